@@ -85,6 +85,13 @@ CHANNEL_LAYERS = {
     },
 }
 
+# WebSocket heartbeat: clients ping every interval, idle sockets are closed
+WEBSOCKET_HEARTBEAT_INTERVAL = 30
+WEBSOCKET_IDLE_TIMEOUT = 90
+
+# Product stock/price deltas are batched and pushed once per interval (seconds)
+PRODUCT_UPDATE_INTERVAL = 0.5
+
 # Django REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
@@ -102,8 +109,22 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
+# Cache shared by all workers (list caches, Idempotency-Key results and locks)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://127.0.0.1:6379/1',
+    },
+}
+
+# Idempotency-Key results for order placement are kept in the default cache
+IDEMPOTENCY_KEY_TIMEOUT = 60 * 60 * 24
+IDEMPOTENCY_LOCK_TIMEOUT = 60
+
 # CORS settings
+from corsheaders.defaults import default_headers
 CORS_ALLOW_ALL_ORIGINS = True
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -115,6 +136,13 @@ DATABASES = {
     }
 }
 
+# Delivered orders are moved into ArchivedOrder by `manage.py archive_orders`.
+# Point ARCHIVE_DATABASE at another alias in DATABASES to keep the archive
+# in a separate database (then run `migrate --database=<alias>`).
+ARCHIVE_DATABASE = 'default'
+ORDER_ARCHIVE_AFTER_DAYS = 365
+DATABASE_ROUTERS = ['shop.routers.ArchiveRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
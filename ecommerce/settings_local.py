@@ -0,0 +1,24 @@
+"""
+Redis-less settings profile for tests, benchmarks and offline development.
+
+Usage:
+    python manage.py runserver --settings=ecommerce.settings_local
+    python manage.py test --settings=ecommerce.settings_local
+
+The in-memory channel layer only delivers messages within one process, so
+this profile is unsuitable for running several workers.
+"""
+
+from .settings import *  # noqa: F401,F403
+
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
@@ -9,15 +9,26 @@ function ClientDashboard({ userId }: ClientDashboardProps) {
 
   useEffect(() => {
     if (!userId) return;
-    const ws = new WebSocket(`ws://127.0.0.1:8000/ws/orders/${userId}/`);
+    const token = localStorage.getItem('access_token');
+    const ws = new WebSocket(`ws://127.0.0.1:8000/ws/shop/?token=${token}`);
+    let heartbeat: ReturnType<typeof setInterval>;
+    ws.onopen = () => {
+      ws.send(JSON.stringify({ action: 'subscribe', stream: 'orders' }));
+      heartbeat = setInterval(() => ws.send(JSON.stringify({ action: 'ping' })), 30000);
+    };
     ws.onmessage = (event) => {
       const data = JSON.parse(event.data);
+      if (data.stream !== 'orders' || data.type !== 'order_status') return;
       setOrderNotifications((prev) => [data, ...prev]);
     };
     ws.onclose = () => {
+      clearInterval(heartbeat);
       // Optionally handle reconnect
     };
-    return () => ws.close();
+    return () => {
+      clearInterval(heartbeat);
+      ws.close();
+    };
   }, [userId]);
 
   return (
@@ -0,0 +1,60 @@
+from django.db import router, transaction
+from .models import ArchivedOrder, Order, OrderItem
+
+
+def pack_items(order_items):
+    return [
+        [item.id, item.product_id, item.product.name, str(item.product.price), item.quantity]
+        for item in order_items
+    ]
+
+
+def archive_orders(cutoff, batch_size=1000):
+    """
+    Move delivered orders created before ``cutoff`` into ``ArchivedOrder``,
+    ``batch_size`` orders at a time, yielding ``(archived, conflicts)`` per
+    batch.
+
+    A live order is only deleted once an archive row with the same id, user
+    and creation time is confirmed. A different row already holding that id
+    is counted as a conflict and the order is left in place. When the archive
+    shares the live database both steps run in one transaction. Otherwise a
+    run interrupted between them is finished by repeating it.
+    """
+    live_db = router.db_for_write(Order)
+    archive_db = router.db_for_write(ArchivedOrder)
+    queryset = Order.objects.filter(status='delivered', created_at__lt=cutoff).order_by('id')
+    last_id = 0
+    while True:
+        orders = list(queryset.filter(id__gt=last_id)[:batch_size])
+        if not orders:
+            return
+        last_id = orders[-1].id
+        items = {}
+        for item in OrderItem.objects.filter(order__in=orders).select_related('product').order_by('id'):
+            items.setdefault(item.order_id, []).append(item)
+        with transaction.atomic(using=live_db), transaction.atomic(using=archive_db):
+            ArchivedOrder.objects.bulk_create([
+                ArchivedOrder(
+                    id=order.id,
+                    user_id=order.user_id,
+                    total_price=order.total_price,
+                    status=order.status,
+                    created_at=order.created_at,
+                    updated_at=order.updated_at,
+                    items=pack_items(items.get(order.id, [])),
+                )
+                for order in orders
+            ], ignore_conflicts=True)
+            stored = {
+                archived_id: (user_id, created_at)
+                for archived_id, user_id, created_at in ArchivedOrder.objects.filter(
+                    id__in=[order.id for order in orders]
+                ).values_list('id', 'user_id', 'created_at')
+            }
+            confirmed = [
+                order.id for order in orders
+                if stored.get(order.id) == (order.user_id, order.created_at)
+            ]
+            Order.objects.filter(id__in=confirmed).delete()
+        yield len(confirmed), len(orders) - len(confirmed)
@@ -1,10 +1,28 @@
+import asyncio
 import json
-from channels.generic.websocket import AsyncWebsocketConsumer
+import time
+from django.conf import settings
+from channels.generic.websocket import AsyncWebsocketConsumer, AsyncJsonWebsocketConsumer
+from .notifications import ADMIN_ORDERS_GROUP, PRODUCT_UPDATES_GROUP, order_status_group, product_updates
+
+# Close codes sent to the client (4000-4999 is reserved for applications)
+CLOSE_UNAUTHENTICATED = 4401
+CLOSE_FORBIDDEN = 4403
+CLOSE_IDLE = 4408
+
 
 class OrderStatusConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.user_id = self.scope['url_route']['kwargs']['user_id']
-        self.group_name = f'order_status_{self.user_id}'
+        self.group_name = None
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close(code=CLOSE_UNAUTHENTICATED)
+            return
+        if str(user.id) != self.user_id and not user.is_staff:
+            await self.close(code=CLOSE_FORBIDDEN)
+            return
+        self.group_name = order_status_group(self.user_id)
         await self.channel_layer.group_add(
             self.group_name,
             self.channel_name
@@ -12,10 +30,11 @@ class OrderStatusConsumer(AsyncWebsocketConsumer):
         await self.accept()
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(
-            self.group_name,
-            self.channel_name
-        )
+        if self.group_name:
+            await self.channel_layer.group_discard(
+                self.group_name,
+                self.channel_name
+            )
 
     async def receive(self, text_data):
         # Not expecting to receive data from client
@@ -25,4 +44,128 @@ class OrderStatusConsumer(AsyncWebsocketConsumer):
         await self.send(text_data=json.dumps({
             'order_id': event['order_id'],
             'status': event['status'],
-        })) 
\ No newline at end of file
+        }))
+
+
+class ShopConsumer(AsyncJsonWebsocketConsumer):
+    """
+    A single authenticated socket per client, multiplexing several streams.
+
+    The client sends ``{"action": "subscribe", "stream": "<name>"}`` or
+    ``{"action": "unsubscribe", "stream": "<name>"}`` to join or leave a
+    stream, and ``{"action": "ping"}`` as a heartbeat. Every frame pushed by
+    the server carries a ``stream`` key so one socket can serve all tabs and
+    widgets. Connections that send nothing for ``WEBSOCKET_IDLE_TIMEOUT``
+    seconds are closed so dead sockets do not pin worker memory.
+    """
+
+    STREAMS = ('orders', 'products', 'admin_orders')
+    STAFF_STREAMS = ('admin_orders',)
+
+    async def connect(self):
+        self.subscriptions = {}
+        self.heartbeat_task = None
+        self.user = self.scope.get('user')
+        if self.user is None or not self.user.is_authenticated:
+            await self.close(code=CLOSE_UNAUTHENTICATED)
+            return
+        await self.accept()
+        self.last_seen = time.monotonic()
+        self.heartbeat_task = asyncio.ensure_future(self.cull_when_idle())
+
+    async def disconnect(self, close_code):
+        if self.heartbeat_task:
+            self.heartbeat_task.cancel()
+        for group_name in self.subscriptions.values():
+            await self.channel_layer.group_discard(group_name, self.channel_name)
+        self.subscriptions = {}
+
+    async def cull_when_idle(self):
+        interval = settings.WEBSOCKET_HEARTBEAT_INTERVAL
+        timeout = settings.WEBSOCKET_IDLE_TIMEOUT
+        while True:
+            await asyncio.sleep(interval)
+            if time.monotonic() - self.last_seen > timeout:
+                await self.close(code=CLOSE_IDLE)
+                return
+
+    def stream_group(self, stream):
+        if stream == 'orders':
+            return order_status_group(self.user.id)
+        if stream == 'products':
+            return PRODUCT_UPDATES_GROUP
+        if stream == 'admin_orders':
+            return ADMIN_ORDERS_GROUP
+        return None
+
+    async def receive(self, text_data=None, bytes_data=None, **kwargs):
+        self.last_seen = time.monotonic()
+        try:
+            content = await self.decode_json(text_data) if text_data is not None else None
+        except ValueError:
+            content = None
+        await self.receive_json(content, **kwargs)
+
+    async def receive_json(self, content, **kwargs):
+        if not isinstance(content, dict):
+            await self.send_json({'type': 'error', 'error': 'Invalid message'})
+            return
+        action = content.get('action')
+        stream = content.get('stream')
+        if action == 'ping':
+            await self.send_json({'type': 'pong'})
+        elif action == 'subscribe':
+            await self.subscribe(stream)
+        elif action == 'unsubscribe':
+            await self.unsubscribe(stream)
+        else:
+            await self.send_json({'type': 'error', 'error': 'Unknown action'})
+
+    async def subscribe(self, stream):
+        if stream not in self.STREAMS:
+            await self.send_json({'type': 'error', 'stream': stream, 'error': 'Unknown stream'})
+            return
+        if stream in self.STAFF_STREAMS and not self.user.is_staff:
+            await self.send_json({'type': 'error', 'stream': stream, 'error': 'Only admin can subscribe to this stream'})
+            return
+        if stream not in self.subscriptions:
+            group_name = self.stream_group(stream)
+            await self.channel_layer.group_add(group_name, self.channel_name)
+            self.subscriptions[stream] = group_name
+            if stream == 'products':
+                product_updates.attach_loop(asyncio.get_running_loop())
+        await self.send_json({'type': 'subscribed', 'stream': stream})
+
+    async def unsubscribe(self, stream):
+        group_name = self.subscriptions.pop(stream, None)
+        if group_name:
+            await self.channel_layer.group_discard(group_name, self.channel_name)
+        await self.send_json({'type': 'unsubscribed', 'stream': stream})
+
+    async def order_status_update(self, event):
+        # The admin feed reuses this event type; tag it so clients can route it
+        stream = 'admin_orders' if event.get('feed') == 'admin' else 'orders'
+        await self.send_json({
+            'stream': stream,
+            'type': 'order_status',
+            'order_id': event['order_id'],
+            'user_id': event.get('user_id'),
+            'status': event['status'],
+        })
+
+    async def order_placed(self, event):
+        await self.send_json({
+            'stream': 'admin_orders',
+            'type': 'order_placed',
+            'order_id': event['order_id'],
+            'user_id': event['user_id'],
+            'total_price': event['total_price'],
+        })
+
+    async def product_update(self, event):
+        await self.send_json({
+            'stream': 'products',
+            'type': 'product_update',
+            'version': event['version'],
+            'products': event['products'],
+        })
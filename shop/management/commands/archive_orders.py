@@ -0,0 +1,33 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from shop.archive import archive_orders
+
+
+class Command(BaseCommand):
+    help = 'Move delivered orders older than a cutoff into the order archive.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.ORDER_ARCHIVE_AFTER_DAYS,
+            help='Archive delivered orders created more than this many days ago.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of orders moved per batch.',
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        total = 0
+        conflicts = 0
+        for archived, conflicted in archive_orders(cutoff, batch_size=options['batch_size']):
+            total += archived
+            conflicts += conflicted
+            self.stdout.write(f'Archived {total} orders...')
+        if conflicts:
+            self.stdout.write(self.style.WARNING(
+                f'Left {conflicts} orders in place: their id is already used by a different archived order.'
+            ))
+        self.stdout.write(self.style.SUCCESS(f'Archived {total} delivered orders created before {cutoff:%Y-%m-%d}.'))
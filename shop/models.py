@@ -27,6 +27,14 @@ class Product(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember loaded stock/price so saves only publish real changes
+        if 'stock' in field_names and 'price' in field_names:
+            instance._loaded_values = {'stock': instance.stock, 'price': instance.price}
+        return instance
+
 class Cart(models.Model):
     user = models.ForeignKey('User', on_delete=models.CASCADE, related_name='carts')
     products = models.ManyToManyField(Product, through='CartItem')
@@ -55,6 +63,12 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['created_at']),
+        ]
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
@@ -62,3 +76,25 @@ class OrderItem(models.Model):
 
     class Meta:
         unique_together = ('order', 'product')
+
+class ArchivedOrder(models.Model):
+    """
+    A delivered order moved out of ``Order``/``OrderItem`` by the
+    ``archive_orders`` command. It keeps the original order id. Line items are
+    packed into ``items`` as ``[item_id, product_id, product_name, price,
+    quantity]`` rows. The row lives in ``settings.ARCHIVE_DATABASE``, so
+    ``user_id`` is a plain column rather than a cross-database foreign key.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user_id = models.BigIntegerField()
+    total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=10, choices=ORDER_STATUS_CHOICES)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    items = models.JSONField(default=list)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user_id', 'created_at']),
+        ]
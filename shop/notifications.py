@@ -0,0 +1,256 @@
+import asyncio
+import threading
+import time
+from decimal import Decimal
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+
+ADMIN_ORDERS_GROUP = 'admin_orders'
+PRODUCT_UPDATES_GROUP = 'product_updates'
+
+PRODUCTS_LIST_KEY = 'products_list'
+PRODUCTS_LIST_TIMEOUT = 3600
+PRODUCTS_VERSION_KEY = 'products_version'
+
+
+def order_status_group(user_id):
+    return f'order_status_{user_id}'
+
+
+def notify_order_placed(order):
+    channel_layer = get_channel_layer()
+    async_to_sync(channel_layer.group_send)(
+        ADMIN_ORDERS_GROUP,
+        {
+            'type': 'order_placed',
+            'order_id': order.id,
+            'user_id': order.user_id,
+            'total_price': str(order.total_price),
+        }
+    )
+
+
+def notify_order_status(order_id, user_id, status):
+    channel_layer = get_channel_layer()
+    async_to_sync(channel_layer.group_send)(
+        order_status_group(user_id),
+        {
+            'type': 'order_status_update',
+            'order_id': order_id,
+            'user_id': user_id,
+            'status': status,
+        }
+    )
+    async_to_sync(channel_layer.group_send)(
+        ADMIN_ORDERS_GROUP,
+        {
+            'type': 'order_status_update',
+            'feed': 'admin',
+            'order_id': order_id,
+            'user_id': user_id,
+            'status': status,
+        }
+    )
+
+
+def next_products_version():
+    try:
+        return cache.incr(PRODUCTS_VERSION_KEY)
+    except ValueError:
+        cache.add(PRODUCTS_VERSION_KEY, 0, timeout=None)
+        return cache.incr(PRODUCTS_VERSION_KEY)
+
+
+def build_products_snapshot(products):
+    """
+    Cache a fresh product list, tagged with the delta version it includes.
+    The version is read before ``products`` is evaluated, so the list may
+    already contain some later deltas. Deltas carry absolute values, so
+    applying them again is harmless.
+    """
+    version = cache.get(PRODUCTS_VERSION_KEY, 0)
+    snapshot = {
+        'version': version,
+        'built_version': version,
+        'built_at': time.time(),
+        'products': [dict(product) for product in products],
+        'versions': {},
+    }
+    cache.set(PRODUCTS_LIST_KEY, snapshot, timeout=PRODUCTS_LIST_TIMEOUT)
+    return snapshot
+
+
+def patch_products_snapshot(deltas):
+    """
+    Apply a batch of deltas to the cached product list instead of dropping
+    it, so clients keep getting a warm snapshot under checkout load. A delta
+    is skipped when the snapshot already holds a newer version of that
+    product.
+    """
+    lock_key = f'{PRODUCTS_LIST_KEY}_lock'
+    for _ in range(50):
+        if cache.add(lock_key, True, timeout=5):
+            break
+        time.sleep(0.01)
+    else:
+        cache.delete(PRODUCTS_LIST_KEY)
+        return
+    try:
+        snapshot = cache.get(PRODUCTS_LIST_KEY)
+        if snapshot is None:
+            return
+        remaining = PRODUCTS_LIST_TIMEOUT - (time.time() - snapshot['built_at'])
+        if remaining <= 0:
+            cache.delete(PRODUCTS_LIST_KEY)
+            return
+        products = {product['id']: product for product in snapshot['products']}
+        versions = snapshot['versions']
+        for delta in deltas:
+            product_id = delta['id']
+            if delta['version'] <= versions.get(product_id, snapshot['built_version']):
+                continue
+            if delta.get('deleted'):
+                products.pop(product_id, None)
+            elif product_id not in products:
+                # A new product cannot be built from a partial row
+                cache.delete(PRODUCTS_LIST_KEY)
+                return
+            else:
+                products[product_id].update(
+                    (field, delta[field]) for field in ('stock', 'price') if field in delta
+                )
+            versions[product_id] = delta['version']
+            snapshot['version'] = max(snapshot['version'], delta['version'])
+        snapshot['products'] = list(products.values())
+        cache.set(PRODUCTS_LIST_KEY, snapshot, timeout=remaining)
+    finally:
+        cache.delete(lock_key)
+
+
+class ProductUpdateBatcher:
+    """
+    Collects product stock/price deltas and pushes them to the ``products``
+    stream in one message per ``PRODUCT_UPDATE_INTERVAL`` seconds.
+
+    Deltas are coalesced per product, so a product sold fifty times within an
+    interval produces a single ``{"id": ..., "stock": ...}`` entry carrying
+    only its latest values. Every delta carries the ``version`` it was
+    published at, and the frame carries the highest one. Clients that loaded
+    the product list (``X-Products-Version``) skip deltas at or below it.
+    Before each batch is sent, it is also applied to the cached list.
+
+    A window opened from async code is flushed with ``loop.call_later`` on
+    that loop; otherwise a timer thread flushes it. The timer thread hands the
+    send to the loop serving this process's ``products`` subscribers, because
+    the in-memory channel layer is not thread-safe.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.timer = None
+        self.generation = 0
+        self.loop = None
+        self.sending = set()
+
+    def attach_loop(self, loop):
+        self.loop = loop
+
+    def add(self, product_id, changes):
+        interval = settings.PRODUCT_UPDATE_INTERVAL
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        with self.lock:
+            self.pending.setdefault(product_id, {'id': product_id}).update(changes)
+            if interval > 0 and self.timer is None:
+                if running_loop is not None:
+                    self.timer = running_loop.call_later(interval, self.flush_soon, self.generation)
+                else:
+                    timer = threading.Timer(interval, self.flush, args=(self.generation,))
+                    timer.daemon = True
+                    self.timer = timer
+                    try:
+                        timer.start()
+                    except RuntimeError:
+                        self.timer = None
+                        raise
+        if interval <= 0:
+            if running_loop is not None:
+                self.flush_soon()
+            else:
+                self.flush()
+
+    def take(self, generation=None):
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                # This window was already sent by an explicit flush()
+                return []
+            if self.timer is not None:
+                self.timer.cancel()
+            self.timer = None
+            self.generation += 1
+            deltas = list(self.pending.values())
+            self.pending = {}
+        return deltas
+
+    def message(self, deltas):
+        return {
+            'type': 'product_update',
+            'version': max(delta['version'] for delta in deltas),
+            'products': deltas,
+        }
+
+    def flush(self, generation=None):
+        """Send pending deltas; must be called from a thread without a running loop."""
+        deltas = self.take(generation)
+        if not deltas:
+            return
+        patch_products_snapshot(deltas)
+        channel_layer = get_channel_layer()
+        message = self.message(deltas)
+        loop = self.loop
+        if loop is not None and loop.is_running():
+            asyncio.run_coroutine_threadsafe(
+                channel_layer.group_send(PRODUCT_UPDATES_GROUP, message), loop
+            ).result()
+        else:
+            async_to_sync(channel_layer.group_send)(PRODUCT_UPDATES_GROUP, message)
+
+    def flush_soon(self, generation=None):
+        """Send pending deltas from code running on an event loop."""
+        deltas = self.take(generation)
+        if deltas:
+            task = asyncio.ensure_future(self.send(deltas))
+            self.sending.add(task)
+            task.add_done_callback(self.sending.discard)
+
+    async def send(self, deltas):
+        await sync_to_async(patch_products_snapshot, thread_sensitive=False)(deltas)
+        channel_layer = get_channel_layer()
+        await channel_layer.group_send(PRODUCT_UPDATES_GROUP, self.message(deltas))
+
+
+product_updates = ProductUpdateBatcher()
+
+
+def publish_product_change(product_id, stock=None, price=None, deleted=False):
+    """
+    Queue a delta for one product. Code that bypasses ``Product.save()``
+    (``bulk_update``, ``QuerySet.update``, bulk imports) should call this for
+    each product it touches so subscribers stay in sync.
+    """
+    changes = {}
+    if stock is not None:
+        changes['stock'] = stock
+    if price is not None:
+        # Match ProductSerializer so patched snapshots render prices the same way
+        changes['price'] = str(Decimal(price).quantize(Decimal('0.01')))
+    if deleted:
+        changes['deleted'] = True
+    if changes:
+        changes['version'] = next_products_version()
+        product_updates.add(product_id, changes)
@@ -0,0 +1,25 @@
+from django.conf import settings
+
+
+class ArchiveRouter:
+    """
+    Sends ``ArchivedOrder`` to ``settings.ARCHIVE_DATABASE`` and keeps its
+    table out of every other database. All other models are left to Django.
+    """
+
+    archive_label = 'shop.ArchivedOrder'
+
+    def db_for_read(self, model, **hints):
+        if model._meta.label == self.archive_label:
+            return settings.ARCHIVE_DATABASE
+        return None
+
+    def db_for_write(self, model, **hints):
+        if model._meta.label == self.archive_label:
+            return settings.ARCHIVE_DATABASE
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label == 'shop' and model_name == 'archivedorder':
+            return db == settings.ARCHIVE_DATABASE
+        return None
@@ -3,4 +3,5 @@ from . import consumers
 
 websocket_urlpatterns = [
     re_path(r'ws/orders/(?P<user_id>\d+)/$', consumers.OrderStatusConsumer.as_asgi()),
+    re_path(r'ws/shop/$', consumers.ShopConsumer.as_asgi()),
 ] 
\ No newline at end of file
@@ -1,7 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
-from .models import Category, Product, Cart, CartItem, Order, OrderItem
+from .models import Category, Product, Cart, CartItem, Order, OrderItem, ArchivedOrder
 
 User = get_user_model()
 
@@ -83,4 +83,26 @@ class OrderSerializer(serializers.ModelSerializer):
 
     def get_items(self, obj):
         items = OrderItem.objects.filter(order=obj)
-        return OrderItemSerializer(items, many=True).data 
\ No newline at end of file
+        return OrderItemSerializer(items, many=True).data
+
+class ArchivedOrderSerializer(serializers.ModelSerializer):
+    """
+    Renders an archived order with the same order fields as ``OrderSerializer``.
+    Each item's ``product`` only has the ``id``, ``name`` and ``price`` packed at
+    archive time.
+    """
+    items = serializers.SerializerMethodField()
+    user = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ArchivedOrder
+        fields = ['id', 'user', 'items', 'total_price', 'status', 'created_at', 'updated_at']
+
+    def get_user(self, obj):
+        return str(self.context['request'].user)
+
+    def get_items(self, obj):
+        return [
+            {'id': item_id, 'product': {'id': product_id, 'name': name, 'price': price}, 'quantity': quantity}
+            for item_id, product_id, name, price, quantity in obj.items
+        ]
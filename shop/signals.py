@@ -0,0 +1,27 @@
+from functools import partial
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import Product
+from .notifications import publish_product_change
+
+
+@receiver(post_save, sender=Product)
+def publish_product_save(sender, instance, created, **kwargs):
+    loaded = getattr(instance, '_loaded_values', None)
+    if created or loaded is None:
+        changes = {'stock': instance.stock, 'price': instance.price}
+    else:
+        changes = {}
+        if instance.stock != loaded['stock']:
+            changes['stock'] = instance.stock
+        if instance.price != loaded['price']:
+            changes['price'] = instance.price
+    instance._loaded_values = {'stock': instance.stock, 'price': instance.price}
+    if changes:
+        transaction.on_commit(partial(publish_product_change, instance.id, **changes))
+
+
+@receiver(post_delete, sender=Product)
+def publish_product_delete(sender, instance, **kwargs):
+    transaction.on_commit(partial(publish_product_change, instance.id, deleted=True))
@@ -1,3 +1,499 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import timedelta
+from unittest import mock
+from channels.db import database_sync_to_async
+from channels.testing import HttpCommunicator, WebsocketCommunicator
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings, tag
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from ecommerce import settings_local
+from ecommerce.asgi import application
+from .notifications import notify_order_status, product_updates, publish_product_change
+from .models import Category, Product, Cart, CartItem, Order, OrderItem, ArchivedOrder, User
 
 # Create your tests here.
+
+
+@override_settings(CHANNEL_LAYERS=settings_local.CHANNEL_LAYERS, CACHES=settings_local.CACHES)
+class OrderStatusNotificationTests(TransactionTestCase):
+    """
+    Drives ``OrderStatusConsumer`` end to end through ``ecommerce.asgi.application``
+    with the in-memory channel layer: sockets connect with a JWT, an admin PATCHes
+    ``update_status`` over ASGI HTTP and every subscriber must receive the frame.
+
+    Set ``WS_BENCHMARK_SUBSCRIBERS`` to change the number of sockets and print
+    the PATCH-to-frame latencies, e.g.
+    ``WS_BENCHMARK_SUBSCRIBERS=1000 python manage.py test --tag benchmark``.
+    """
+
+    SUBSCRIBERS = int(os.environ.get('WS_BENCHMARK_SUBSCRIBERS', 50))
+    REPORT = 'WS_BENCHMARK_SUBSCRIBERS' in os.environ
+    LATENCY_BUDGET = 5.0
+
+    def setUp(self):
+        self.customer = User.objects.create_user('customer', password='pass')
+        self.other = User.objects.create_user('other', password='pass')
+        self.admin = User.objects.create_user('admin', password='pass', is_staff=True)
+        category = Category.objects.create(name='Books')
+        Product.objects.create(name='Novel', price='10.00', stock=5, category=category)
+        self.order = Order.objects.create(user=self.customer, total_price='10.00')
+        self.customer_token = str(AccessToken.for_user(self.customer))
+        self.other_token = str(AccessToken.for_user(self.other))
+        self.admin_token = str(AccessToken.for_user(self.admin))
+
+    async def connect(self, user, token):
+        communicator = WebsocketCommunicator(application, f'/ws/orders/{user.id}/?token={token}')
+        connected, code = await communicator.connect()
+        self.assertTrue(connected, code)
+        return communicator
+
+    async def patch_status(self, order_id, status_value):
+        body = json.dumps({'status': status_value}).encode()
+        communicator = HttpCommunicator(
+            application,
+            'PATCH',
+            f'/api/orders/{order_id}/update_status/',
+            body=body,
+            headers=[
+                (b'host', b'testserver'),
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+                (b'authorization', f'Bearer {self.admin_token}'.encode()),
+            ],
+        )
+        response = await communicator.get_response()
+        # The response is sent before Django's handler returns; let it finish
+        await communicator.wait()
+        return response
+
+    async def receive_frame(self, communicator, started):
+        frame = await communicator.receive_json_from(timeout=self.LATENCY_BUDGET)
+        return frame, time.perf_counter() - started
+
+    async def test_rejects_anonymous_and_foreign_sockets(self):
+        communicator = WebsocketCommunicator(application, f'/ws/orders/{self.customer.id}/')
+        connected, code = await communicator.connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, 4401)
+
+        communicator = WebsocketCommunicator(
+            application, f'/ws/orders/{self.customer.id}/?token={self.other_token}'
+        )
+        connected, code = await communicator.connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, 4403)
+
+    @tag('benchmark')
+    async def test_notification_latency_under_many_subscribers(self):
+        subscribers = await asyncio.gather(*[
+            self.connect(self.customer, self.customer_token) for _ in range(self.SUBSCRIBERS)
+        ])
+        bystander = await self.connect(self.other, self.other_token)
+
+        started = time.perf_counter()
+        response = await self.patch_status(self.order.id, 'shipped')
+        self.assertEqual(response['status'], 200, response['body'])
+        results = await asyncio.gather(*[
+            self.receive_frame(communicator, started) for communicator in subscribers
+        ])
+
+        for frame, _ in results:
+            self.assertEqual(frame, {'order_id': self.order.id, 'status': 'shipped'})
+        self.assertTrue(await bystander.receive_nothing())
+        order = await database_sync_to_async(Order.objects.get)(pk=self.order.id)
+        self.assertEqual(order.status, 'shipped')
+
+        latencies = sorted(latency for _, latency in results)
+        if self.REPORT:
+            p95 = latencies[max(int(len(latencies) * 0.95) - 1, 0)]
+            sys.stderr.write(
+                f'\n{self.SUBSCRIBERS} subscribers: PATCH to frame '
+                f'median {statistics.median(latencies) * 1000:.1f} ms, '
+                f'p95 {p95 * 1000:.1f} ms, max {latencies[-1] * 1000:.1f} ms\n'
+            )
+        self.assertLess(latencies[-1], self.LATENCY_BUDGET)
+
+        await asyncio.gather(*[communicator.disconnect() for communicator in subscribers])
+        await bystander.disconnect()
+
+
+@override_settings(CHANNEL_LAYERS=settings_local.CHANNEL_LAYERS, CACHES=settings_local.CACHES)
+class ShopConsumerTests(TransactionTestCase):
+    def setUp(self):
+        self.customer = User.objects.create_user('customer', password='pass')
+        self.admin = User.objects.create_user('admin', password='pass', is_staff=True)
+        self.customer_token = str(AccessToken.for_user(self.customer))
+        self.admin_token = str(AccessToken.for_user(self.admin))
+
+    async def connect(self, token):
+        communicator = WebsocketCommunicator(application, f'/ws/shop/?token={token}')
+        connected, code = await communicator.connect()
+        self.assertTrue(connected, code)
+        return communicator
+
+    async def send(self, communicator, message):
+        await communicator.send_json_to(message)
+        return await communicator.receive_json_from()
+
+    async def test_requires_valid_token(self):
+        for path in ['/ws/shop/', '/ws/shop/?token=not-a-jwt']:
+            communicator = WebsocketCommunicator(application, path)
+            connected, code = await communicator.connect()
+            self.assertFalse(connected)
+            self.assertEqual(code, 4401)
+
+        communicator = await self.connect(self.customer_token)
+        self.assertEqual(await self.send(communicator, {'action': 'ping'}), {'type': 'pong'})
+        await communicator.disconnect()
+
+    async def test_session_cookie_is_not_accepted(self):
+        await database_sync_to_async(self.client.force_login)(self.admin)
+        session_key = self.client.cookies['sessionid'].value
+        communicator = WebsocketCommunicator(
+            application, '/ws/shop/', headers=[(b'cookie', f'sessionid={session_key}'.encode())],
+        )
+        connected, code = await communicator.connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, 4401)
+
+    async def test_subscribe_and_unsubscribe(self):
+        communicator = await self.connect(self.customer_token)
+        self.assertEqual(
+            await self.send(communicator, {'action': 'subscribe', 'stream': 'orders'}),
+            {'type': 'subscribed', 'stream': 'orders'},
+        )
+        await database_sync_to_async(notify_order_status)(7, self.customer.id, 'shipped')
+        self.assertEqual(await communicator.receive_json_from(), {
+            'stream': 'orders', 'type': 'order_status', 'order_id': 7, 'user_id': self.customer.id, 'status': 'shipped',
+        })
+
+        self.assertEqual(
+            await self.send(communicator, {'action': 'unsubscribe', 'stream': 'orders'}),
+            {'type': 'unsubscribed', 'stream': 'orders'},
+        )
+        await database_sync_to_async(notify_order_status)(7, self.customer.id, 'delivered')
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+
+    async def test_admin_stream_is_staff_only(self):
+        communicator = await self.connect(self.customer_token)
+        self.assertEqual(
+            await self.send(communicator, {'action': 'subscribe', 'stream': 'admin_orders'}),
+            {'type': 'error', 'stream': 'admin_orders', 'error': 'Only admin can subscribe to this stream'},
+        )
+        self.assertEqual(
+            await self.send(communicator, {'action': 'subscribe', 'stream': 'nope'}),
+            {'type': 'error', 'stream': 'nope', 'error': 'Unknown stream'},
+        )
+        await communicator.disconnect()
+
+    async def test_frames_are_tagged_with_their_stream(self):
+        customer = await self.connect(self.customer_token)
+        admin = await self.connect(self.admin_token)
+        await self.send(customer, {'action': 'subscribe', 'stream': 'orders'})
+        await self.send(admin, {'action': 'subscribe', 'stream': 'admin_orders'})
+
+        await database_sync_to_async(notify_order_status)(7, self.customer.id, 'shipped')
+        self.assertEqual((await customer.receive_json_from())['stream'], 'orders')
+        frame = await admin.receive_json_from()
+        self.assertEqual(frame['stream'], 'admin_orders')
+        self.assertEqual(frame['user_id'], self.customer.id)
+        self.assertTrue(await customer.receive_nothing())
+        await customer.disconnect()
+        await admin.disconnect()
+
+    async def test_malformed_frames_get_error_reply(self):
+        communicator = await self.connect(self.customer_token)
+        for frame in ['not json', '[1, 2]']:
+            await communicator.send_to(text_data=frame)
+            self.assertEqual(await communicator.receive_json_from(), {'type': 'error', 'error': 'Invalid message'})
+        self.assertEqual(await self.send(communicator, {'action': 'ping'}), {'type': 'pong'})
+        await communicator.disconnect()
+
+    @override_settings(WEBSOCKET_HEARTBEAT_INTERVAL=0.05, WEBSOCKET_IDLE_TIMEOUT=0.2)
+    async def test_idle_socket_is_closed(self):
+        communicator = await self.connect(self.customer_token)
+        for _ in range(3):
+            await asyncio.sleep(0.1)
+            self.assertEqual(await self.send(communicator, {'action': 'ping'}), {'type': 'pong'})
+        output = await communicator.receive_output(timeout=2)
+        self.assertEqual(output, {'type': 'websocket.close', 'code': 4408})
+
+
+@override_settings(
+    CHANNEL_LAYERS=settings_local.CHANNEL_LAYERS,
+    CACHES=settings_local.CACHES,
+    PRODUCT_UPDATE_INTERVAL=0.2,
+)
+class ProductUpdateStreamTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('customer', password='pass')
+        self.category = Category.objects.create(name='Books')
+        self.product = Product.objects.create(name='Novel', price='10.00', stock=5, category=self.category)
+        self.token = str(AccessToken.for_user(self.user))
+        # Send the creation delta now, before any test socket subscribes
+        product_updates.flush()
+        self.version = cache.get('products_version')
+
+    async def subscribe(self):
+        communicator = WebsocketCommunicator(application, f'/ws/shop/?token={self.token}')
+        connected, code = await communicator.connect()
+        self.assertTrue(connected, code)
+        await communicator.send_json_to({'action': 'subscribe', 'stream': 'products'})
+        self.assertEqual(await communicator.receive_json_from(), {'type': 'subscribed', 'stream': 'products'})
+        return communicator
+
+    @database_sync_to_async
+    def sell(self, quantities):
+        product = Product.objects.get(pk=self.product.pk)
+        for quantity in quantities:
+            product.stock -= quantity
+            product.save()
+        product.name = 'Renamed'
+        product.save()
+
+    async def test_deltas_carry_changed_fields_and_coalesce_per_product(self):
+        communicator = await self.subscribe()
+        await self.sell([1, 2])
+
+        frame = await communicator.receive_json_from(timeout=2)
+        self.assertEqual(frame, {
+            'stream': 'products',
+            'type': 'product_update',
+            'version': self.version + 2,
+            'products': [{'id': self.product.pk, 'stock': 2, 'version': self.version + 2}],
+        })
+        self.assertTrue(await communicator.receive_nothing(timeout=0.5))
+        await communicator.disconnect()
+
+    async def test_publishing_from_async_code_keeps_batcher_working(self):
+        communicator = await self.subscribe()
+        publish_product_change(self.product.pk, stock=4)
+        frame = await communicator.receive_json_from(timeout=2)
+        self.assertEqual(frame['products'], [{'id': self.product.pk, 'stock': 4, 'version': self.version + 1}])
+
+        await database_sync_to_async(publish_product_change)(self.product.pk, stock=3)
+        frame = await communicator.receive_json_from(timeout=2)
+        self.assertEqual(frame['products'], [{'id': self.product.pk, 'stock': 3, 'version': self.version + 2}])
+        await communicator.disconnect()
+
+    async def test_delete_publishes_deleted_flag(self):
+        communicator = await self.subscribe()
+        await database_sync_to_async(lambda: Product.objects.get(pk=self.product.pk).delete())()
+
+        frame = await communicator.receive_json_from(timeout=2)
+        self.assertEqual(frame['products'], [{'id': self.product.pk, 'deleted': True, 'version': self.version + 1}])
+        await communicator.disconnect()
+
+    async def test_place_publishes_stock_and_patches_cached_list(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        @database_sync_to_async
+        def place():
+            cart = Cart.objects.create(user=self.user)
+            CartItem.objects.create(cart=cart, product=self.product, quantity=2)
+            return client.post('/api/orders/place/')
+
+        communicator = await self.subscribe()
+        listing = await database_sync_to_async(client.get)('/api/products/')
+        self.assertEqual(listing['X-Products-Version'], str(self.version))
+        response = await place()
+        self.assertEqual(response.status_code, 200)
+
+        frame = await communicator.receive_json_from(timeout=2)
+        self.assertEqual(frame['version'], self.version + 1)
+        self.assertEqual(frame['products'], [{'id': self.product.pk, 'stock': 3, 'version': self.version + 1}])
+
+        # The cached list was patched rather than dropped, and says so
+        @database_sync_to_async
+        def list_from_cache():
+            with self.assertNumQueries(0):
+                return client.get('/api/products/')
+
+        listing = await list_from_cache()
+        self.assertEqual(listing['X-Products-Version'], str(self.version + 1))
+        self.assertEqual([(p['id'], p['stock']) for p in listing.data], [(self.product.pk, 3)])
+        await communicator.disconnect()
+
+
+@override_settings(CHANNEL_LAYERS=settings_local.CHANNEL_LAYERS, CACHES=settings_local.CACHES)
+class PlaceOrderIdempotencyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('customer', password='pass')
+        category = Category.objects.create(name='Books')
+        self.product = Product.objects.create(name='Novel', price='10.00', stock=5, category=category)
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=2)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_retry_with_same_key_replays_response(self):
+        first = self.client.post('/api/orders/place/', HTTP_IDEMPOTENCY_KEY='checkout-1')
+        self.assertEqual(first.status_code, 200)
+
+        with self.assertNumQueries(0):
+            retry = self.client.post('/api/orders/place/', HTTP_IDEMPOTENCY_KEY='checkout-1')
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.filter(user=self.user).count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 3)
+
+    def test_failed_notification_does_not_break_replay(self):
+        with mock.patch('shop.views.notify_order_placed', side_effect=ConnectionError), \
+                self.assertLogs('django.test', 'ERROR'), \
+                self.captureOnCommitCallbacks(execute=True):
+            first = self.client.post('/api/orders/place/', HTTP_IDEMPOTENCY_KEY='checkout-1')
+        self.assertEqual(first.status_code, 200)
+
+        retry = self.client.post('/api/orders/place/', HTTP_IDEMPOTENCY_KEY='checkout-1')
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.data['order_id'], first.data['order_id'])
+
+    def test_keys_are_scoped_per_user(self):
+        self.client.post('/api/orders/place/', HTTP_IDEMPOTENCY_KEY='checkout-1')
+        other = User.objects.create_user('other', password='pass')
+        self.client.force_authenticate(other)
+        response = self.client.post('/api/orders/place/', HTTP_IDEMPOTENCY_KEY='checkout-1')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'error': 'Cart is empty'})
+
+
+@override_settings(CACHES=settings_local.CACHES)
+class OrderArchiveTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('customer', password='pass')
+        category = Category.objects.create(name='Books')
+        self.product = Product.objects.create(name='Novel', price='10.00', stock=5, category=category)
+        self.old = self.create_order('delivered', days_ago=400)
+        self.old_pending = self.create_order('pending', days_ago=400)
+        self.recent = self.create_order('delivered', days_ago=10)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_order(self, status_value, days_ago):
+        order = Order.objects.create(user=self.user, total_price='20.00', status=status_value)
+        OrderItem.objects.create(order=order, product=self.product, quantity=2)
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+        return order
+
+    def test_archives_only_old_delivered_orders(self):
+        call_command('archive_orders', days=365, batch_size=1, stdout=io.StringIO())
+
+        self.assertFalse(Order.objects.filter(pk=self.old.pk).exists())
+        self.assertFalse(OrderItem.objects.filter(order_id=self.old.pk).exists())
+        self.assertEqual(set(Order.objects.values_list('pk', flat=True)), {self.old_pending.pk, self.recent.pk})
+        archived = ArchivedOrder.objects.get(pk=self.old.pk)
+        self.assertEqual(archived.user_id, self.user.id)
+        self.assertEqual(archived.items[0][1:], [self.product.id, 'Novel', '10.00', 2])
+
+    def test_keeps_live_order_when_archive_id_is_taken(self):
+        ArchivedOrder.objects.create(
+            id=self.old.pk, user_id=self.user.id + 100, total_price='1.00', status='delivered',
+            created_at=timezone.now(), updated_at=timezone.now(),
+        )
+        out = io.StringIO()
+        call_command('archive_orders', days=365, stdout=out)
+
+        self.assertTrue(Order.objects.filter(pk=self.old.pk).exists())
+        self.assertEqual(ArchivedOrder.objects.get(pk=self.old.pk).user_id, self.user.id + 100)
+        self.assertIn('Left 1 orders in place', out.getvalue())
+
+    def test_history_lists_order_in_both_tables_once(self):
+        old = Order.objects.get(pk=self.old.pk)
+        ArchivedOrder.objects.create(
+            id=old.pk, user_id=self.user.id, total_price=old.total_price, status=old.status,
+            created_at=old.created_at, updated_at=old.updated_at,
+        )
+        response = self.client.get('/api/orders/')
+        self.assertEqual([order['id'] for order in response.data], [self.old.pk, self.old_pending.pk, self.recent.pk])
+
+    def test_history_includes_archived_orders(self):
+        before = self.client.get('/api/orders/').data
+        call_command('archive_orders', days=365, stdout=io.StringIO())
+        after = self.client.get('/api/orders/').data
+
+        self.assertEqual([order['id'] for order in after], [order['id'] for order in before])
+        archived = after[0]
+        self.assertEqual(archived['id'], self.old.pk)
+        self.assertEqual(archived['status'], 'delivered')
+        self.assertEqual(archived['user'], 'customer')
+        self.assertEqual(archived['items'][0]['product']['name'], 'Novel')
+        self.assertEqual(archived['items'][0]['quantity'], 2)
+
+
+@override_settings(CHANNEL_LAYERS=settings_local.CHANNEL_LAYERS, CACHES=settings_local.CACHES)
+class OrderAdminTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', password='pass')
+        category = Category.objects.create(name='Books')
+        product = Product.objects.create(name='Novel', price='10.00', stock=5, category=category)
+        self.orders = []
+        for index in range(5):
+            user = User.objects.create_user(f'customer{index}', password='pass')
+            order = Order.objects.create(user=user, total_price='10.00')
+            OrderItem.objects.create(order=order, product=product, quantity=1)
+            self.orders.append(order)
+        self.client.force_login(self.admin)
+
+    def test_changelist_query_count_does_not_grow_with_rows(self):
+        with self.assertNumQueries(4):
+            response = self.client.get('/admin/shop/order/')
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(4):
+            response = self.client.get('/admin/shop/orderitem/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_bulk_mark_shipped(self):
+        response = self.client.post('/admin/shop/order/', {
+            'action': 'mark_shipped',
+            '_selected_action': [order.pk for order in self.orders[:3]],
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Order.objects.filter(status='shipped').count(), 3)
+        self.assertEqual(Order.objects.filter(status='pending').count(), 2)
+
+    def test_archived_orders_are_read_only(self):
+        archived = ArchivedOrder.objects.create(
+            id=999, user_id=self.admin.id, total_price='1.00', status='delivered',
+            created_at=timezone.now(), updated_at=timezone.now(),
+        )
+        self.assertEqual(self.client.get('/admin/shop/archivedorder/add/').status_code, 403)
+        response = self.client.post(f'/admin/shop/archivedorder/{archived.pk}/change/', {'items': '[1]'})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.client.get(f'/admin/shop/archivedorder/{archived.pk}/change/').status_code, 200)
+
+    def test_bulk_action_sends_notifications_after_commit(self):
+        with mock.patch('shop.admin.notify_order_status') as notify:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                self.client.post('/admin/shop/order/', {
+                    'action': 'mark_delivered',
+                    '_selected_action': [order.pk for order in self.orders],
+                })
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(
+            sorted(call.args for call in notify.call_args_list),
+            [(order.pk, order.user_id, 'delivered') for order in self.orders],
+        )
+
+    def test_bulk_action_refuses_oversized_selection(self):
+        with mock.patch('shop.admin.BULK_STATUS_LIMIT', 3):
+            response = self.client.post('/admin/shop/order/', {
+                'action': 'mark_shipped',
+                '_selected_action': [order.pk for order in self.orders],
+            }, follow=True)
+        self.assertContains(response, 'Select at most 3 orders at a time')
+        self.assertEqual(Order.objects.filter(status='pending').count(), 5)
@@ -1,13 +1,15 @@
+import hashlib
+from django.conf import settings
+from django.db import transaction
 from django.shortcuts import render
 from rest_framework import generics, permissions, viewsets, status
 from django.contrib.auth import get_user_model
-from .serializers import UserRegisterSerializer, UserProfileSerializer, CategorySerializer, ProductSerializer, CartSerializer, CartItemSerializer, OrderSerializer
-from .models import Category, Product, Cart, CartItem, Order, OrderItem
+from .serializers import UserRegisterSerializer, UserProfileSerializer, CategorySerializer, ProductSerializer, CartSerializer, CartItemSerializer, OrderSerializer, ArchivedOrderSerializer
+from .models import Category, Product, Cart, CartItem, Order, OrderItem, ArchivedOrder
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
 from django.core.cache import cache
+from .notifications import build_products_snapshot, notify_order_placed, notify_order_status
 
 User = get_user_model()
 
@@ -67,13 +69,13 @@ class ProductViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAdminOrReadOnly]
 
     def list(self, request, *args, **kwargs):
+        # The cached list is kept current by product deltas; its version tells
+        # socket clients which `products` frames it already includes
         cached = cache.get('products_list')
-        if cached:
-            return Response(cached)
-        queryset = self.get_queryset().select_related('category')
-        serializer = self.get_serializer(queryset, many=True)
-        cache.set('products_list', serializer.data, timeout=3600)
-        return Response(serializer.data)
+        if not cached:
+            queryset = self.get_queryset().select_related('category')
+            cached = build_products_snapshot(self.get_serializer(queryset, many=True).data)
+        return Response(cached['products'], headers={'X-Products-Version': str(cached['version'])})
 
     def perform_create(self, serializer):
         result = serializer.save()
@@ -139,12 +141,44 @@ class OrderViewSet(viewsets.ViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def list(self, request):
-        orders = Order.objects.filter(user=request.user)
+        orders = list(Order.objects.filter(user=request.user))
         serializer = OrderSerializer(orders, many=True)
-        return Response(serializer.data)
+        # Orders moved out by archive_orders are listed ahead of live orders.
+        # An interrupted run against a separate archive database can leave an
+        # order in both places until it is re-run; the live row wins.
+        archived = ArchivedOrder.objects.filter(user_id=request.user.id).exclude(
+            id__in=[order.id for order in orders]
+        ).order_by('id')
+        archived_data = ArchivedOrderSerializer(archived, many=True, context={'request': request}).data
+        return Response(archived_data + serializer.data)
 
     @action(detail=False, methods=['post'])
     def place(self, request):
+        # Clients retry slow checkouts; an Idempotency-Key header makes the
+        # retry replay the first response instead of placing a second order.
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if not idempotency_key:
+            return self.place_order(request)
+        key_hash = hashlib.sha256(idempotency_key.encode()).hexdigest()
+        cache_key = f'idempotency_place_{request.user.id}_{key_hash}'
+        lock_key = f'{cache_key}_lock'
+        stored = cache.get(cache_key)
+        if stored is None:
+            if not cache.add(lock_key, True, timeout=settings.IDEMPOTENCY_LOCK_TIMEOUT):
+                return Response({'error': 'A request with this Idempotency-Key is already in progress'}, status=status.HTTP_409_CONFLICT)
+            try:
+                stored = cache.get(cache_key)
+                if stored is None:
+                    response = self.place_order(request)
+                    cache.set(cache_key, {'data': response.data, 'status': response.status_code}, timeout=settings.IDEMPOTENCY_KEY_TIMEOUT)
+                    return response
+            finally:
+                cache.delete(lock_key)
+        response = Response(stored['data'], status=stored['status'])
+        response['Idempotent-Replayed'] = 'true'
+        return response
+
+    def place_order(self, request):
         cart, created = Cart.objects.get_or_create(user=request.user)
         cart_items = CartItem.objects.filter(cart=cart)
         if not cart_items.exists():
@@ -162,6 +196,9 @@ class OrderViewSet(viewsets.ViewSet):
         order.total_price = total_price
         order.save()
         cart_items.delete()
+        # A failed notification must not turn a placed order into a 500, or an
+        # Idempotency-Key retry would run again against the emptied cart
+        transaction.on_commit(lambda: notify_order_placed(order), robust=True)
         return Response({'success': 'Order placed', 'order_id': order.id})
 
     @action(detail=True, methods=['patch'])
@@ -178,13 +215,5 @@ class OrderViewSet(viewsets.ViewSet):
         order.status = status_value
         order.save()
         # Send WebSocket notification
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f'order_status_{order.user.id}',
-            {
-                'type': 'order_status_update',
-                'order_id': order.id,
-                'status': order.status,
-            }
-        )
+        notify_order_status(order.id, order.user_id, order.status)
         return Response({'success': 'Order status updated'})